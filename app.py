@@ -2,7 +2,9 @@ import streamlit as st
 from google import genai
 from PyPDF2 import PdfReader
 from dotenv import load_dotenv
+from precompute import Precomputer, fingerprint
 import os
+import io
 import re
 import json
 
@@ -25,13 +27,13 @@ MODEL_NAME = "gemini-1.5-flash"  # ✅ supported model
 # =============================
 # Helper Functions
 # =============================
-def extract_text(file):
-    """Extract text from PDF or TXT"""
-    if file.type == "application/pdf":
-        reader = PdfReader(file)
+def extract_text(data, file_type):
+    """Extract text from PDF or TXT bytes"""
+    if file_type == "application/pdf":
+        reader = PdfReader(io.BytesIO(data))
         return "".join(page.extract_text() or "" for page in reader.pages)
     else:
-        return file.read().decode("utf-8", errors="ignore")
+        return data.decode("utf-8", errors="ignore")
 
 def limit_text(text, max_chars=5000):
     """Prevent token overflow"""
@@ -82,6 +84,22 @@ STUDENT ANSWER:
 
     return response.text
 
+def extract_and_evaluate(original_data, original_type, student_data, student_type):
+    """Full pipeline from uploaded bytes to Gemini's raw response"""
+    original_text = limit_text(extract_text(original_data, original_type))
+    student_text = limit_text(extract_text(student_data, student_type))
+    return evaluate(original_text, student_text)
+
+def precompute_evaluation(*inputs):
+    """Speculative run; raises on unparseable output so it is never served"""
+    raw_result = extract_and_evaluate(*inputs)
+    json.loads(clean_json(raw_result))
+    return raw_result
+
+@st.cache_resource(show_spinner=False)
+def get_precomputer():
+    return Precomputer()
+
 # =============================
 # Streamlit UI (SPA)
 # =============================
@@ -90,6 +108,8 @@ st.set_page_config(
     layout="centered"
 )
 
+precomputer = get_precomputer()
+
 st.title("📄 AI Document Examiner (Gemini)")
 st.write(
     "Upload the **Original / Reference Answer** and the **Student Written Answer** "
@@ -110,21 +130,47 @@ student_file = st.file_uploader(
 
 st.divider()
 
+# Start evaluating as soon as both files are in. Jobs are keyed by file
+# contents, so the same pair is served across sessions; a changed upload
+# cancels this session's unfinished job for the previous pair.
+job_key = None
+if original_file and student_file:
+    inputs = (
+        original_file.getvalue(), original_file.type,
+        student_file.getvalue(), student_file.type,
+    )
+    inputs_fp = fingerprint(*inputs)
+    job_key = f"evaluation:{inputs_fp}"
+    precomputer.schedule(job_key, inputs_fp, precompute_evaluation, *inputs)
+
+previous_key = st.session_state.get("evaluation_key")
+if previous_key and previous_key != job_key:
+    precomputer.cancel(previous_key)
+st.session_state.evaluation_key = job_key
+
 if st.button("🧠 Evaluate Answer", use_container_width=True):
 
     if not original_file or not student_file:
         st.warning("⚠️ Please upload BOTH documents.")
     else:
         with st.spinner("Evaluating with Gemini AI..."):
+            raw_result = None
             try:
-                original_text = limit_text(extract_text(original_file))
-                student_text = limit_text(extract_text(student_file))
-
-                raw_result = evaluate(original_text, student_text)
-                cleaned_result = clean_json(raw_result)
-
-                # Validate JSON
-                parsed = json.loads(cleaned_result)
+                parsed = None
+                raw_result = precomputer.get(job_key, inputs_fp)
+                if raw_result is not None:
+                    try:
+                        parsed = json.loads(clean_json(raw_result))
+                    except json.JSONDecodeError:
+                        precomputer.discard(job_key)
+
+                if parsed is None:
+                    raw_result = extract_and_evaluate(*inputs)
+                    cleaned_result = clean_json(raw_result)
+
+                    # Validate JSON; only a usable result is kept for re-presses
+                    parsed = json.loads(cleaned_result)
+                    precomputer.put(job_key, inputs_fp, raw_result)
 
                 st.subheader("📊 Evaluation Result")
                 st.json(parsed)
@@ -1,12 +1,15 @@
 import streamlit as st
-import os, json
+import os
 from dotenv import load_dotenv
 from groq import Groq
+from history_index import HistoryIndex, build_messages
+from conversation_cache import ConversationCache
 
 # ------------------ CONFIG ------------------
 st.set_page_config(page_title="Persistent GenAI Chatbot", layout="centered")
 
 CONVERSATION_FILE = "conversation.json"
+RENDER_WINDOW = 30  # messages shown per "load older" step
 
 # ------------------ LOAD API KEY ------------------
 load_dotenv()
@@ -19,24 +22,51 @@ if not api_key:
 client = Groq(api_key=api_key)
 
 # ------------------ CONVERSATION STORAGE ------------------
-def load_conversation():
-    if not os.path.exists(CONVERSATION_FILE):
-        return []
-    with open(CONVERSATION_FILE, "r") as f:
-        return json.load(f)
-
-def save_conversation(conv):
-    with open(CONVERSATION_FILE, "w") as f:
-        json.dump(conv, f, indent=2)
+# Shared across sessions; writes are flushed to disk by a background thread
+# and the history index follows the stored conversation
+@st.cache_resource
+def get_conversation_store():
+    cache = ConversationCache()
+    index = HistoryIndex(CONVERSATION_FILE)
+    cache.add_listener(CONVERSATION_FILE, index)
+    return cache, index
+
+conversation_cache, history_index = get_conversation_store()
+
+def stream_reply(messages):
+    try:
+        stream = client.chat.completions.create(
+            model="llama-3.3-70b-versatile",
+            messages=messages,
+            stream=True
+        )
+        for chunk in stream:
+            token = chunk.choices[0].delta.content
+            if token:
+                yield token
+    except Exception as e:
+        yield f"Error: {e}"
 
 # ------------------ SESSION STATE ------------------
 if "conversation" not in st.session_state:
-    st.session_state.conversation = load_conversation()
+    st.session_state.conversation = conversation_cache.get(CONVERSATION_FILE)
+
+if "render_count" not in st.session_state:
+    st.session_state.render_count = RENDER_WINDOW
 
 # ------------------ UI ------------------
 st.title("🤖 Persistent GenAI Chatbot")
 
-for msg in st.session_state.conversation:
+# Only the most recent messages are rendered; older ones load on demand
+conversation = st.session_state.conversation
+hidden = len(conversation) - st.session_state.render_count
+
+if hidden > 0:
+    if st.button(f"⬆️ Load older messages ({hidden} hidden)"):
+        st.session_state.render_count += RENDER_WINDOW
+        st.rerun()
+
+for msg in conversation[-st.session_state.render_count:]:
     if msg["role"] == "user":
         st.chat_message("user").write(msg["content"])
     else:
@@ -46,29 +76,23 @@ for msg in st.session_state.conversation:
 user_input = st.chat_input("Type your message...")
 
 if user_input:
-    st.session_state.conversation.append(
-        {"role": "user", "content": user_input}
+    user_turn = {"role": "user", "content": user_input}
+    st.session_state.conversation.append(user_turn)
+    st.chat_message("user").write(user_input)
+
+    # Prompt from the shared store so index rows line up with it
+    prompt = build_messages(
+        conversation_cache.get(CONVERSATION_FILE) + [user_turn], history_index
     )
 
+    # Rendered in place below the history, no rerun needed
     with st.chat_message("assistant"):
-        with st.spinner("Thinking..."):
-            try:
-                response = client.chat.completions.create(
-                    model="llama-3.3-70b-versatile",
-                    messages=st.session_state.conversation
-                )
-                bot_reply = response.choices[0].message.content
-            except Exception as e:
-                bot_reply = f"Error: {e}"
-
-            st.write(bot_reply)
-
-    st.session_state.conversation.append(
-        {"role": "assistant", "content": bot_reply}
-    )
+        bot_reply = st.write_stream(stream_reply(prompt))
 
-    save_conversation(st.session_state.conversation)
-    st.rerun()
+    assistant_turn = {"role": "assistant", "content": bot_reply}
+    st.session_state.conversation.append(assistant_turn)
+
+    conversation_cache.append(CONVERSATION_FILE, user_turn, assistant_turn)
 
 # ------------------ SUMMARY ------------------
 st.divider()
@@ -94,5 +118,6 @@ if st.button("📝 Summarize Conversation"):
 # ------------------ CLEAR ------------------
 if st.button("🗑️ Clear Conversation"):
     st.session_state.conversation = []
-    save_conversation([])
+    st.session_state.render_count = RENDER_WINDOW
+    conversation_cache.clear(CONVERSATION_FILE)
     st.rerun()
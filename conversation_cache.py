@@ -0,0 +1,165 @@
+import os, json, stat, time, atexit, tempfile, threading
+
+# ------------------ CONFIG ------------------
+FLUSH_INTERVAL = 2.0  # seconds between background flushes
+
+
+class ConversationCache:
+    """In-process conversation store, written behind to disk.
+
+    Each conversation file is a session held in memory as the source of
+    truth. Mutations take that session's lock, mark it dirty and return
+    immediately; a background thread writes dirty sessions out on an interval
+    (and once more on shutdown) via temp file + atomic rename.
+
+    Listeners (e.g. a HistoryIndex) get sync(conversation) under the session
+    lock after every change, so they see stored turns in stored order, and
+    flush() from the flush thread.
+    """
+
+    def __init__(self, flush_interval=FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self.sessions = {}
+        self.locks = {}
+        self.dirty = {}          # path -> time of oldest unflushed change
+        self.listeners = {}      # path -> [listener]
+        self.registry_lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.last_flush = None
+        self.flushes = 0
+        self.flush_errors = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    # ------------------ SESSIONS ------------------
+    def _lock(self, path):
+        with self.registry_lock:
+            if path not in self.locks:
+                self.locks[path] = threading.Lock()
+            return self.locks[path]
+
+    def _session(self, path):
+        # Caller holds the session lock
+        if path not in self.sessions:
+            if os.path.exists(path):
+                with open(path, "r") as f:
+                    self.sessions[path] = json.load(f)
+            else:
+                self.sessions[path] = []
+        return self.sessions[path]
+
+    def _mark_dirty(self, path):
+        # Caller holds the session lock
+        with self.registry_lock:
+            self.dirty.setdefault(path, time.monotonic())
+            listeners = list(self.listeners.get(path, ()))
+        for listener in listeners:
+            listener.sync(self.sessions[path])
+
+    def add_listener(self, path, listener):
+        """Keep listener in step with the conversation stored at path"""
+        with self._lock(path):
+            listener.sync(self._session(path))
+            with self.registry_lock:
+                self.listeners.setdefault(path, []).append(listener)
+
+    def get(self, path):
+        """Snapshot of the conversation"""
+        with self._lock(path):
+            return list(self._session(path))
+
+    def append(self, path, *messages):
+        """Append messages atomically and return the updated snapshot"""
+        with self._lock(path):
+            conversation = self._session(path)
+            conversation.extend(messages)
+            self._mark_dirty(path)
+            return list(conversation)
+
+    def clear(self, path):
+        with self._lock(path):
+            self.sessions[path] = []
+            self._mark_dirty(path)
+
+    # ------------------ PERSISTENCE ------------------
+    def flush(self):
+        """Write every dirty session to disk"""
+        with self.flush_lock:
+            with self.registry_lock:
+                pending = dict(self.dirty)
+
+            for path, since in pending.items():
+                with self._lock(path):
+                    snapshot = list(self._session(path))
+                    with self.registry_lock:
+                        self.dirty.pop(path, None)
+                try:
+                    _atomic_write(path, snapshot)
+                except OSError:
+                    self.flush_errors += 1
+                    with self.registry_lock:
+                        self.dirty[path] = min(since, self.dirty.get(path, since))
+                    continue
+                self.flushes += 1
+
+            with self.registry_lock:
+                listeners = [l for ls in self.listeners.values() for l in ls]
+            for listener in listeners:
+                try:
+                    listener.flush()
+                except OSError:
+                    self.flush_errors += 1
+
+            self.last_flush = time.time()
+
+    def flush_lag(self):
+        """Seconds since the oldest change not yet on disk (0 when clean)"""
+        with self.registry_lock:
+            if not self.dirty:
+                return 0.0
+            return time.monotonic() - min(self.dirty.values())
+
+    def stats(self):
+        with self.registry_lock:
+            dirty_sessions = len(self.dirty)
+        return {
+            "flush_lag_seconds": round(self.flush_lag(), 3),
+            "dirty_sessions": dirty_sessions,
+            "flushes": self.flushes,
+            "flush_errors": self.flush_errors,
+            "last_flush": self.last_flush,
+        }
+
+    def _run(self):
+        while not self.stop_event.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        """Stop the flush thread and write out anything still dirty"""
+        if not self.stop_event.is_set():
+            self.stop_event.set()
+            self.thread.join()
+        self.flush()
+
+
+def _atomic_write(path, conversation):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".conversation-", suffix=".tmp")
+    try:
+        # mkstemp creates 0600; keep the existing file's mode across the rename
+        try:
+            mode = stat.S_IMODE(os.stat(path).st_mode)
+        except FileNotFoundError:
+            mode = 0o644
+        os.chmod(tmp_path, mode)
+        with os.fdopen(fd, "w") as f:
+            json.dump(conversation, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -1,9 +1,14 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
 from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-import os, json
+import os, json, asyncio
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-from groq import Groq
+from groq import Groq, AsyncGroq
+from history_index import HistoryIndex, build_messages
+from conversation_cache import ConversationCache
+from precompute import Precomputer, conversation_fingerprint
 
 # ================== ENV + GROQ ==================
 load_dotenv()
@@ -12,9 +17,17 @@ if not api_key:
     raise RuntimeError("GROQ_API_KEY is required")
 
 client = Groq(api_key=api_key)
+async_client = AsyncGroq(api_key=api_key)
 
 # ================== FASTAPI APP ==================
-app = FastAPI(title="Persistent GenAI Chatbot")
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    # The final flush is what makes the write-behind cache durable
+    precomputer.shutdown()
+    conversation_cache.close()
+
+app = FastAPI(title="Persistent GenAI Chatbot", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -30,13 +43,64 @@ if not os.path.exists(CONVERSATION_FILE):
     with open(CONVERSATION_FILE, "w") as f:
         json.dump([], f)
 
+# Embedding index over stored turns, used to pick relevant history
+history_index = HistoryIndex(CONVERSATION_FILE)
+
+# In-memory conversation store, flushed to the file in the background
+conversation_cache = ConversationCache()
+conversation_cache.add_listener(CONVERSATION_FILE, history_index)
+
 def load_conversation():
-    with open(CONVERSATION_FILE, "r") as f:
-        return json.load(f)
+    return conversation_cache.get(CONVERSATION_FILE)
 
-def save_conversation(conv):
-    with open(CONVERSATION_FILE, "w") as f:
-        json.dump(conv, f, indent=2)
+# Summaries are precomputed once a chat of a few turns has gone idle
+precomputer = Precomputer()
+SUMMARY_IDLE_SECONDS = 45
+SUMMARY_MIN_MESSAGES = 6  # three exchanges
+
+def summarize_conversation(conversation):
+    response = client.chat.completions.create(
+        model="llama-3.3-70b-versatile",
+        messages=[{
+            "role": "user",
+            "content": "Summarize the following conversation briefly:\n" +
+                       "\n".join(f"{m['role']}: {m['content']}" for m in conversation)
+        }]
+    )
+    return response.choices[0].message.content
+
+def append_turns(*turns):
+    conversation = conversation_cache.append(CONVERSATION_FILE, *turns)
+
+    # Each new turn resets the idle timer and cancels any stale summary
+    if len(conversation) >= SUMMARY_MIN_MESSAGES:
+        precomputer.schedule(
+            "summary", conversation_fingerprint(conversation),
+            summarize_conversation, conversation, delay=SUMMARY_IDLE_SECONDS
+        )
+
+# Replies by client message id, so a message resent over HTTP after the
+# socket dropped is answered from here instead of being stored twice
+REMEMBERED_REPLIES = 512
+replies = OrderedDict()
+in_flight = {}  # message id -> Future resolved once the socket reply is stored
+
+def remember_reply(message_id, reply):
+    if not message_id:
+        return
+    replies[message_id] = reply
+    replies.move_to_end(message_id)
+    while len(replies) > REMEMBERED_REPLIES:
+        replies.popitem(last=False)
+
+def release(message_id):
+    waiter = in_flight.pop(message_id, None)
+    if waiter and not waiter.done():
+        waiter.set_result(None)
+
+def message_id_of(data):
+    message_id = data.get("id")
+    return message_id if isinstance(message_id, str) and message_id else None
 
 # ================== HTML UI ==================
 HTML = """
@@ -105,6 +169,71 @@ HTML = """
 </div>
 
 <script>
+let socket = null;
+let pending = [];        // {id, msg} sent over the socket still awaiting "done"
+let replyStarted = false;
+let retryDelay = 1000;
+
+function connectSocket() {
+    const proto = location.protocol === "https:" ? "wss" : "ws";
+    const ws = new WebSocket(`${proto}://${location.host}/ws`);
+    ws.onopen = () => { socket = ws; retryDelay = 1000; };
+    ws.onclose = async () => {
+        socket = null;
+        setTimeout(connectSocket, retryDelay);
+        retryDelay = Math.min(retryDelay * 2, 30000);
+
+        // Resend unanswered messages over HTTP; the id lets the server return
+        // the stored reply instead of answering twice
+        const chat = document.getElementById("chat-box");
+        if (replyStarted) {
+            const replies = chat.getElementsByClassName("reply");
+            replies[replies.length - 1].parentElement.remove();
+            replyStarted = false;
+        }
+        const unanswered = pending;
+        pending = [];
+        for (const item of unanswered) await sendOverHttp(item.msg, item.id);
+    };
+    ws.onmessage = e => {
+        const data = JSON.parse(e.data);
+        const chat = document.getElementById("chat-box");
+        if (data.type === "start") {
+            replyStarted = true;
+            chat.innerHTML += `<div class="bot-msg"><b>Bot:</b> <span class="reply"></span></div>`;
+        } else if (data.type === "token") {
+            const replies = chat.getElementsByClassName("reply");
+            replies[replies.length - 1].textContent += data.content;
+        } else if (data.type === "done") {
+            replyStarted = false;
+            pending = pending.filter(item => item.id !== data.id);
+        } else if (data.type === "error") {
+            pending = pending.filter(item => item.id !== data.id);
+            chat.innerHTML += `<div class="bot-msg"><b>Bot:</b> ${data.error}</div>`;
+        }
+        chat.scrollTop = chat.scrollHeight;
+    };
+}
+
+function newMessageId() {
+    return window.crypto && crypto.randomUUID
+        ? crypto.randomUUID()
+        : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+}
+
+async function sendOverHttp(msg, id) {
+    const chat = document.getElementById("chat-box");
+    const res = await fetch("/chat", {
+        method: "POST",
+        headers: {"Content-Type": "application/json"},
+        body: JSON.stringify({id, message: msg})
+    });
+
+    const data = await res.json();
+    chat.innerHTML += `<div class="bot-msg"><b>Bot:</b> ${data.reply || data.error}</div>`;
+    chat.scrollTop = chat.scrollHeight;
+}
+
 async function sendMessage() {
     const input = document.getElementById("user-input");
     const msg = input.value.trim();
@@ -114,15 +243,15 @@ async function sendMessage() {
     chat.innerHTML += `<div class="user-msg"><b>You:</b> ${msg}</div>`;
     input.value = "";
 
-    const res = await fetch("/chat", {
-        method: "POST",
-        headers: {"Content-Type": "application/json"},
-        body: JSON.stringify({message: msg})
-    });
+    const id = newMessageId();
+    if (socket && socket.readyState === WebSocket.OPEN) {
+        pending.push({id, msg});
+        socket.send(JSON.stringify({id, message: msg}));
+        return;
+    }
 
-    const data = await res.json();
-    chat.innerHTML += `<div class="bot-msg"><b>Bot:</b> ${data.reply}</div>`;
-    chat.scrollTop = chat.scrollHeight;
+    // Fallback: plain HTTP when the WebSocket is unavailable
+    await sendOverHttp(msg, id);
 }
 
 async function summarizeConversation() {
@@ -144,6 +273,8 @@ window.onload = async () => {
         chat.innerHTML += `<div class="${cls}"><b>${name}:</b> ${m.content}</div>`;
     });
     chat.scrollTop = chat.scrollHeight;
+
+    if ("WebSocket" in window) connectSocket();
 };
 
 document.getElementById("user-input")
@@ -167,25 +298,36 @@ async def load():
 @app.post("/chat")
 async def chat(req: Request):
     data = await req.json()
+    if not isinstance(data, dict):
+        data = {}
     user_message = data.get("message")
 
     if not user_message:
         return JSONResponse({"error": "No message provided"}, status_code=400)
 
-    conversation = load_conversation()
-    conversation.append({"role": "user", "content": user_message})
+    # A resend of a message the socket already answered (or is answering)
+    message_id = message_id_of(data)
+    if message_id in in_flight:
+        await in_flight[message_id]
+    if message_id in replies:
+        return {"reply": replies[message_id]}
+
+    user_turn = {"role": "user", "content": user_message}
+    conversation = load_conversation() + [user_turn]
 
     try:
-        response = client.chat.completions.create(
+        # Keep the event loop free so open WebSocket streams keep flowing
+        messages = await asyncio.to_thread(build_messages, conversation, history_index)
+        response = await async_client.chat.completions.create(
             model="llama-3.3-70b-versatile",
-            messages=conversation
+            messages=messages
         )
         bot_reply = response.choices[0].message.content
     except Exception as e:
         bot_reply = f"Error: {str(e)}"
 
-    conversation.append({"role": "assistant", "content": bot_reply})
-    save_conversation(conversation)
+    append_turns(user_turn, {"role": "assistant", "content": bot_reply})
+    remember_reply(message_id, bot_reply)
 
     return {"reply": bot_reply}
 
@@ -195,17 +337,93 @@ async def summary():
     if not conversation:
         return {"summary": "No conversation yet."}
 
-    try:
-        response = client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[{
-                "role": "user",
-                "content": "Summarize the following conversation briefly:\n" +
-                           "\n".join(f"{m['role']}: {m['content']}" for m in conversation)
-            }]
-        )
-        summary_text = response.choices[0].message.content
-    except Exception as e:
-        summary_text = f"Error: {str(e)}"
+    fp = conversation_fingerprint(conversation)
+    summary_text = await asyncio.to_thread(precomputer.get, "summary", fp)
+    if summary_text is None:
+        try:
+            summary_text = await asyncio.to_thread(summarize_conversation, conversation)
+            precomputer.put("summary", fp, summary_text)
+        except Exception as e:
+            summary_text = f"Error: {str(e)}"
 
     return {"summary": summary_text}
+
+@app.get("/stats")
+async def stats():
+    return conversation_cache.stats()
+
+@app.websocket("/ws")
+async def chat_socket(websocket: WebSocket):
+    await websocket.accept()
+
+    message_id = None
+    try:
+        while True:
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
+
+            # Binary frames carry no "text"; anything else must be a JSON object
+            try:
+                data = json.loads(frame.get("text") or "")
+            except json.JSONDecodeError:
+                data = None
+            if not isinstance(data, dict):
+                data = {}
+            user_message = data.get("message")
+            message_id = message_id_of(data)
+
+            if not isinstance(user_message, str) or not user_message.strip():
+                await websocket.send_json(
+                    {"type": "error", "id": message_id, "error": "No message provided"}
+                )
+                continue
+
+            if message_id in replies:
+                reply = replies[message_id]
+                await websocket.send_json({"type": "start"})
+                await websocket.send_json({"type": "token", "content": reply})
+                await websocket.send_json({"type": "done", "id": message_id, "reply": reply})
+                continue
+
+            # Context comes from the in-memory cache, shared with /chat
+            user_turn = {"role": "user", "content": user_message}
+            conversation = load_conversation() + [user_turn]
+            if message_id:
+                in_flight[message_id] = asyncio.get_running_loop().create_future()
+            await websocket.send_json({"type": "start"})
+
+            parts = []
+            try:
+                messages = await asyncio.to_thread(
+                    build_messages, conversation, history_index
+                )
+                stream = await async_client.chat.completions.create(
+                    model="llama-3.3-70b-versatile",
+                    messages=messages,
+                    stream=True
+                )
+                async for chunk in stream:
+                    token = chunk.choices[0].delta.content
+                    if token:
+                        parts.append(token)
+                        await websocket.send_json({"type": "token", "content": token})
+            except WebSocketDisconnect:
+                raise
+            except Exception as e:
+                error = f"Error: {str(e)}"
+                parts.append(error)
+                await websocket.send_json({"type": "token", "content": error})
+
+            # Store before "done": if the socket drops now, the HTTP resend
+            # finds the reply by id instead of asking the model again
+            bot_reply = "".join(parts)
+            append_turns(user_turn, {"role": "assistant", "content": bot_reply})
+            remember_reply(message_id, bot_reply)
+            release(message_id)
+            await websocket.send_json({"type": "done", "id": message_id, "reply": bot_reply})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # A reply cut off mid-stream is not stored; let a waiting resend proceed
+        release(message_id)
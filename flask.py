@@ -2,6 +2,9 @@ from flask import Flask, request, render_template_string, jsonify
 import os, json
 from dotenv import load_dotenv
 from groq import Groq
+from history_index import HistoryIndex, build_messages
+from conversation_cache import ConversationCache
+from precompute import Precomputer, conversation_fingerprint
 
 # Load API key
 load_dotenv()
@@ -22,6 +25,9 @@ if not os.path.exists(CONVERSATION_FILE):
     with open(CONVERSATION_FILE, "w") as f:
         json.dump([], f)
 
+# Embedding index over stored turns, used to pick relevant history
+history_index = HistoryIndex(CONVERSATION_FILE)
+
 # HTML template
 HTML = """
 <!DOCTYPE html>
@@ -98,15 +104,29 @@ HTML = """
 </html>
 """
 
-# Load conversation from file
-def load_conversation():
-    with open(CONVERSATION_FILE, "r") as f:
-        return json.load(f)
+# In-memory conversation store, flushed to the file in the background
+conversation_cache = ConversationCache()
+conversation_cache.add_listener(CONVERSATION_FILE, history_index)
 
-# Save conversation to file
-def save_conversation(conv):
-    with open(CONVERSATION_FILE, "w") as f:
-        json.dump(conv, f, indent=2)
+# Snapshot of the current conversation
+def load_conversation():
+    return conversation_cache.get(CONVERSATION_FILE)
+
+# Summaries are precomputed once a chat of a few turns has gone idle
+precomputer = Precomputer()
+SUMMARY_IDLE_SECONDS = 45
+SUMMARY_MIN_MESSAGES = 6  # three exchanges
+
+def summarize_conversation(conversation):
+    summary_completion = client.chat.completions.create(
+        messages=[{
+            "role": "user",
+            "content": "Summarize the following conversation briefly:\n" +
+                       "\n".join([f"{m['role']}: {m['content']}" for m in conversation])
+        }],
+        model="llama-3.3-70b-versatile"
+    )
+    return summary_completion.choices[0].message.content
 
 @app.route("/")
 def home():
@@ -123,20 +143,29 @@ def chat():
     if not user_message:
         return jsonify({"error": "No message provided"}), 400
 
-    conversation = load_conversation()
-    conversation.append({"role": "user", "content": user_message})
+    user_turn = {"role": "user", "content": user_message}
+    conversation = load_conversation() + [user_turn]
 
     try:
         chat_completion = client.chat.completions.create(
-            messages=conversation,
+            messages=build_messages(conversation, history_index),
             model="llama-3.3-70b-versatile"
         )
         bot_reply = chat_completion.choices[0].message.content
     except Exception as e:
         bot_reply = f"Error: {str(e)}"
 
-    conversation.append({"role": "assistant", "content": bot_reply})
-    save_conversation(conversation)
+    # Both turns are appended together under the session lock
+    conversation = conversation_cache.append(
+        CONVERSATION_FILE, user_turn, {"role": "assistant", "content": bot_reply}
+    )
+
+    # Each new turn resets the idle timer and cancels any stale summary
+    if len(conversation) >= SUMMARY_MIN_MESSAGES:
+        precomputer.schedule(
+            "summary", conversation_fingerprint(conversation),
+            summarize_conversation, conversation, delay=SUMMARY_IDLE_SECONDS
+        )
 
     return jsonify({"reply": bot_reply})
 
@@ -146,20 +175,20 @@ def summary():
     if not conversation:
         return jsonify({"summary": "No conversation yet."})
 
-    try:
-        summary_completion = client.chat.completions.create(
-            messages=[{
-                "role": "user",
-                "content": "Summarize the following conversation briefly:\n" +
-                           "\n".join([f"{m['role']}: {m['content']}" for m in conversation])
-            }],
-            model="llama-3.3-70b-versatile"
-        )
-        summary_text = summary_completion.choices[0].message.content
-    except Exception as e:
-        summary_text = f"Error generating summary: {str(e)}"
+    fp = conversation_fingerprint(conversation)
+    summary_text = precomputer.get("summary", fp)
+    if summary_text is None:
+        try:
+            summary_text = summarize_conversation(conversation)
+            precomputer.put("summary", fp, summary_text)
+        except Exception as e:
+            summary_text = f"Error generating summary: {str(e)}"
 
     return jsonify({"summary": summary_text})
 
+@app.route("/stats")
+def stats():
+    return jsonify(conversation_cache.stats())
+
 if __name__ == "__main__":
     app.run(debug=True)
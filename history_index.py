@@ -0,0 +1,238 @@
+import os, json, re, hashlib, threading
+import numpy as np
+
+# ------------------ CONFIG ------------------
+EMBEDDING_DIM = 2048
+INDEX_FORMAT = 3
+RECENT_MESSAGES = 10     # always sent verbatim
+RELEVANT_MESSAGES = 4    # earlier turns retrieved per message
+MIN_SIMILARITY = 0.1     # weaker matches are not worth the prompt space
+SEARCH_CHUNK = 1024      # rows scored per step, bounds search memory
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a about above after again all am an and any are as at be because been before
+being below between both but by can could did do does doing down during each
+few for from further had has have having he her here hers herself him himself
+his how i if in into is it its itself just let me more most my myself no nor
+not now of off on once only or other our ours ourselves out over own same she
+should so some such than that the their theirs them themselves then there
+these they this those through to too under until up very was we were what when
+where which while who whom why will with would you your yours yourself
+yourselves hi hello hey ok okay please thanks thank yes m s t re ve ll d
+""".split())
+
+
+# ------------------ EMBEDDING ------------------
+def _bucket(feature, dim):
+    digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") % dim
+
+def _tokens(text):
+    tokens = []
+    for token in TOKEN_RE.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        # Crude plural folding so "decorators" matches "decorator"
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+def embed(texts, dim=EMBEDDING_DIM):
+    """Hashed term-frequency vectors (unigrams + bigrams, stopwords dropped)
+
+    Values are sublinear counts; IDF weighting and normalisation happen at
+    search time, since document frequencies change as turns are added.
+    """
+    vectors = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        tokens = _tokens(text)
+        features = tokens + [f"{a}_{b}" for a, b in zip(tokens, tokens[1:])]
+        for feature in features:
+            vectors[row, _bucket(feature, dim)] += 1.0
+    np.log1p(vectors, out=vectors)
+    return vectors
+
+def _fingerprint(message):
+    text = f"{message['role']}:{message['content']}"
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+# ------------------ INDEX ------------------
+class HistoryIndex:
+    """Embedding index over stored conversation turns, as a memory-mapped array.
+
+    Row i holds the vector of conversation[i]. The sidecar meta file records
+    how many rows are valid and a fingerprint of the last indexed turn, so a
+    cleared or rewritten conversation triggers a rebuild instead of serving
+    stale rows. The index is meant to be a ConversationCache listener: sync()
+    runs under the session lock on every change and only touches memory,
+    flush() persists it from the cache's flush thread.
+    """
+
+    def __init__(self, conversation_file, dim=EMBEDDING_DIM):
+        base = os.path.splitext(conversation_file)[0]
+        self.vectors_file = base + ".index.f32"
+        self.meta_file = base + ".index.json"
+        self.dim = dim
+        self.count = 0
+        self.last = None
+        self.vectors = None
+        self.df = np.zeros(dim, dtype=np.float32)
+        self.dirty = False
+        self.lock = threading.Lock()
+        self._open()
+
+    def _open(self):
+        if os.path.exists(self.meta_file) and os.path.exists(self.vectors_file):
+            with open(self.meta_file, "r") as f:
+                meta = json.load(f)
+            capacity = os.path.getsize(self.vectors_file) // (4 * self.dim)
+            if (meta.get("format") == INDEX_FORMAT and meta.get("dim") == self.dim
+                    and meta.get("count", 0) <= capacity):
+                self.count = meta["count"]
+                self.last = meta.get("last")
+                self.vectors = np.memmap(
+                    self.vectors_file, dtype=np.float32, mode="r+",
+                    shape=(capacity, self.dim)
+                )
+                self.df = (self.vectors[:self.count] > 0).sum(axis=0).astype(np.float32)
+                return
+        self._reset()
+
+    def _reset(self):
+        self.count = 0
+        self.last = None
+        self.vectors = None
+        self.df[:] = 0
+        self.dirty = True
+        if os.path.exists(self.vectors_file):
+            os.remove(self.vectors_file)
+
+    def _reserve(self, needed):
+        capacity = 0 if self.vectors is None else self.vectors.shape[0]
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2, 256)
+        if self.vectors is not None:
+            self.vectors.flush()
+            del self.vectors
+        with open(self.vectors_file, "ab") as f:
+            f.truncate(new_capacity * self.dim * 4)
+        self.vectors = np.memmap(
+            self.vectors_file, dtype=np.float32, mode="r+",
+            shape=(new_capacity, self.dim)
+        )
+
+    def sync(self, conversation):
+        """Embed stored turns not yet indexed, rebuilding if the store diverged"""
+        with self.lock:
+            if self.count > len(conversation) or (
+                self.count and _fingerprint(conversation[self.count - 1]) != self.last
+            ):
+                self._reset()
+
+            new = conversation[self.count:]
+            if not new:
+                return
+
+            self._reserve(len(conversation))
+            rows = embed([m["content"] for m in new], self.dim)
+            self.vectors[self.count:len(conversation)] = rows
+            self.df += (rows > 0).sum(axis=0)
+            self.count = len(conversation)
+            self.last = _fingerprint(conversation[-1])
+            self.dirty = True
+
+    def flush(self):
+        """Persist vectors and meta if anything changed since the last flush"""
+        with self.lock:
+            if not self.dirty:
+                return
+            if self.vectors is not None:
+                self.vectors.flush()
+            meta = {"format": INDEX_FORMAT, "dim": self.dim,
+                    "count": self.count, "last": self.last}
+            self.dirty = False
+        with open(self.meta_file, "w") as f:
+            json.dump(meta, f)
+
+    def search(self, query, limit=None, min_score=MIN_SIMILARITY):
+        """(index, score) of rows among the first `limit` scoring at least
+        min_score, best first"""
+        # Only snapshot under the lock: rows below count never change in
+        # place, and a rebuild or regrowth swaps in a new memmap rather than
+        # touching the one held here
+        with self.lock:
+            n = self.count if limit is None else min(limit, self.count)
+            if n <= 0:
+                return []
+            vectors = self.vectors
+            idf = np.log((self.count + 1) / (self.df + 1)) + 1.0
+
+        q = embed([query], self.dim)[0] * idf
+        q_norm = np.linalg.norm(q)
+        if q_norm == 0:
+            return []
+
+        # cos(d*idf, q) = d.(q*idf) / (|q| * sqrt(d^2 . idf^2)), scored a
+        # chunk at a time straight from the memmap
+        q_weighted = (q * idf).astype(np.float32)
+        idf_squared = (idf * idf).astype(np.float32)
+        scores = np.empty(n, dtype=np.float32)
+        for start in range(0, n, SEARCH_CHUNK):
+            chunk = vectors[start:min(start + SEARCH_CHUNK, n)]
+            norms = np.sqrt(np.square(chunk) @ idf_squared)
+            norms[norms == 0] = 1.0
+            scores[start:start + len(chunk)] = (chunk @ q_weighted) / (norms * q_norm)
+
+        top = np.flatnonzero(scores >= min_score)
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(i), float(scores[i])) for i in top]
+
+
+# ------------------ PROMPT ------------------
+def build_messages(conversation, index, recent=RECENT_MESSAGES, k=RELEVANT_MESSAGES):
+    """Recent window plus the earlier turns most relevant to the last message.
+
+    `conversation` is the stored conversation plus the pending user turn, so
+    row positions in the index line up with it. A matched user turn brings
+    its answer along (and a matched answer its question).
+    """
+    window = conversation[-recent:]
+    cutoff = len(conversation) - len(window)
+    if cutoff <= 0:
+        return list(window)
+
+    def exchange(i):
+        role = conversation[i]["role"]
+        if role == "user" and i + 1 < cutoff and conversation[i + 1]["role"] == "assistant":
+            return [i, i + 1]
+        if role == "assistant" and i > 0 and conversation[i - 1]["role"] == "user":
+            return [i - 1, i]
+        return [i]
+
+    # Walk hits best first, taking k distinct exchanges; a repeated question
+    # or answer (or one already in the window) does not use up a slot
+    seen = {m["content"] for m in window}
+    rows = set()
+    picked = 0
+    for i, _ in index.search(conversation[-1]["content"], limit=cutoff):
+        if picked >= k:
+            break
+        turns = exchange(i)
+        if any(conversation[j]["content"] in seen for j in turns):
+            continue
+        seen.update(conversation[j]["content"] for j in turns)
+        rows.update(turns)
+        picked += 1
+
+    if not rows:
+        return list(window)
+
+    context = "Relevant earlier conversation:\n" + "\n".join(
+        f"{conversation[i]['role']}: {conversation[i]['content']}" for i in sorted(rows)
+    )
+    return [{"role": "system", "content": context}] + list(window)
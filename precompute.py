@@ -0,0 +1,208 @@
+import os, time, queue, atexit, hashlib, threading
+from collections import deque, OrderedDict
+from concurrent.futures import Future
+
+# ------------------ CONFIG ------------------
+# Max speculative remote calls per window; 0 disables precomputation
+PRECOMPUTE_BUDGET = int(os.getenv("PRECOMPUTE_BUDGET", "20"))
+PRECOMPUTE_WINDOW = 3600  # seconds
+PRECOMPUTE_WAIT = 60      # max seconds a request waits on an in-flight job
+PRECOMPUTE_MAX_ENTRIES = 64  # jobs/results kept; least recently used go first
+PRECOMPUTE_WORKERS = 2    # a stale running job cannot hold up the next one
+
+
+def fingerprint(*parts):
+    """Stable hash of the inputs a precomputed result depends on"""
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        h.update(part)
+        h.update(b"\0")
+    return h.hexdigest()
+
+def conversation_fingerprint(conversation):
+    last = conversation[-1] if conversation else {"role": "", "content": ""}
+    return fingerprint(str(len(conversation)), last["role"], last["content"])
+
+
+class _Job:
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.future = None
+        self.timer = None
+        self.cancelled = False
+
+
+class Precomputer:
+    """Background queue for results the user is likely to ask for next.
+
+    Jobs are keyed by name and tagged with a fingerprint of their inputs.
+    Scheduling a key with a new fingerprint cancels the old job: a pending
+    timer or queued job never runs, and a running job's result is dropped.
+    Each job that actually starts spends one unit of the budget, and at most
+    max_entries keys are kept (least recently used evicted).
+
+    Jobs run on daemon workers, so a speculative remote call never holds up
+    interpreter exit; shutdown() cancels whatever is still queued.
+    """
+
+    def __init__(self, budget=PRECOMPUTE_BUDGET, window=PRECOMPUTE_WINDOW,
+                 max_entries=PRECOMPUTE_MAX_ENTRIES, workers=PRECOMPUTE_WORKERS):
+        self.budget = budget
+        self.window = window
+        self.max_entries = max_entries
+        self.spent = deque()
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.closed = False
+        self.workers = [
+            threading.Thread(target=self._work, name=f"precompute-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for worker in self.workers:
+            worker.start()
+        atexit.register(self.shutdown)
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            future, fn, args = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def _store(self, key, job):
+        # Caller holds the lock
+        self.jobs[key] = job
+        self.jobs.move_to_end(key)
+        while len(self.jobs) > self.max_entries:
+            _, evicted = self.jobs.popitem(last=False)
+            self._cancel(evicted)
+
+    @property
+    def enabled(self):
+        return self.budget > 0
+
+    def _spend(self):
+        # Caller holds the lock
+        now = time.monotonic()
+        while self.spent and now - self.spent[0] > self.window:
+            self.spent.popleft()
+        if len(self.spent) >= self.budget:
+            return False
+        self.spent.append(now)
+        return True
+
+    def _cancel(self, job):
+        # Caller holds the lock
+        job.cancelled = True
+        if job.timer:
+            job.timer.cancel()
+        if job.future and job.future.cancel() and self.spent:
+            # Never started, so it did not cost anything
+            self.spent.pop()
+
+    def schedule(self, key, fingerprint, fn, *args, delay=0):
+        """Run fn(*args) in the background unless key already has these inputs"""
+        if not self.enabled:
+            return
+        with self.lock:
+            if self.closed:
+                return
+            current = self.jobs.get(key)
+            if current and current.fingerprint == fingerprint:
+                return
+            if current:
+                self._cancel(current)
+
+            job = _Job(fingerprint)
+            self._store(key, job)
+            if delay:
+                job.timer = threading.Timer(delay, self._submit, (key, job, fn, args))
+                job.timer.daemon = True
+                job.timer.start()
+            else:
+                self._submit_locked(key, job, fn, args)
+
+    def _submit(self, key, job, fn, args):
+        with self.lock:
+            self._submit_locked(key, job, fn, args)
+
+    def _submit_locked(self, key, job, fn, args):
+        if self.closed or job.cancelled or self.jobs.get(key) is not job:
+            return
+        if not self._spend():
+            # Over budget: forget the job so a request computes it live
+            del self.jobs[key]
+            return
+        job.future = Future()
+        self.queue.put((job.future, fn, args))
+
+    def get(self, key, fingerprint, timeout=PRECOMPUTE_WAIT):
+        """Precomputed result for these inputs, or None if the caller must compute it"""
+        with self.lock:
+            job = self.jobs.get(key)
+            if not job or job.fingerprint != fingerprint:
+                return None
+            if job.future is None or not (job.future.running() or job.future.done()):
+                # Still waiting for idle or queued behind other work: waiting
+                # could be slower than the live call the caller makes anyway
+                self._cancel(job)
+                del self.jobs[key]
+                return None
+            self.jobs.move_to_end(key)
+            future = job.future
+
+        try:
+            return future.result(timeout=timeout)
+        except Exception:
+            # Failed, cancelled or too slow: fall back to a live call
+            with self.lock:
+                if self.jobs.get(key) is job and future.done():
+                    del self.jobs[key]
+            return None
+
+    def put(self, key, fingerprint, result):
+        """Store a result computed on the request path so repeats are served from it"""
+        with self.lock:
+            current = self.jobs.get(key)
+            if current:
+                self._cancel(current)
+            job = _Job(fingerprint)
+            job.future = Future()
+            job.future.set_result(result)
+            self._store(key, job)
+
+    def discard(self, key):
+        """Forget key entirely, e.g. a stored result that turned out unusable"""
+        with self.lock:
+            job = self.jobs.pop(key, None)
+            if job:
+                self._cancel(job)
+
+    def cancel(self, key):
+        """Drop unfinished work for key; a finished result stays available"""
+        with self.lock:
+            job = self.jobs.get(key)
+            if job and not (job.future and job.future.done()):
+                del self.jobs[key]
+                self._cancel(job)
+
+    def shutdown(self):
+        """Cancel pending timers and queued jobs and stop the worker"""
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            for job in self.jobs.values():
+                self._cancel(job)
+            self.jobs.clear()
+        for _ in self.workers:
+            self.queue.put(None)